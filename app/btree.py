@@ -1,59 +1,69 @@
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterator
+
 from .serial_type import SQLiteSerialType
 from .database import Database
-from .page import BTreeWalker, Page
+from .page import BTreeWalker, Page, PageType
 from .varint import Varint
 
 
 class CellCounter(BTreeWalker[int]):
+    __slots__ = ()
+
     def visit_leaf(self, page: Page) -> int:
         return page.cell_count
 
 
-class RecordCollector(BTreeWalker[list[tuple[int, bytes]]]):
+class RecordCollector(BTreeWalker[Iterator[tuple[int, memoryview]]]):
+    __slots__ = ("target_row_id",)
+
     def __init__(self, target_row_id: int | None = None):
         self.target_row_id = target_row_id
 
     def visit_leaf(self, page: Page):
-        if self.target_row_id:
+        if self.target_row_id is not None:
             return self._binary_search(page)
         else:
             return self._full_scan(page)
 
     def _binary_search(self, page: Page):
-        if not self.target_row_id:
+        target_row_id = self.target_row_id
+        if target_row_id is None:
             raise Exception("Tried to use binary search without a target row id")
 
         left, right = 0, page.cell_count - 1
+        data, cell_pointers = page.data, page.cell_pointers
 
         while left <= right:
             mid = (left + right) // 2
-            cell_pointer = page.cell_pointers[mid]
-            row_id = page.get_row_id(cell_pointer)
-
-            if self.target_row_id == row_id.value:
-                record_size = page.get_record_size(cell_pointer)
-                offset = cell_pointer + record_size.bytes_length + row_id.bytes_length
-                data = page.data[offset : offset + record_size.value]
-                return (row_id.value, data)
-            elif self.target_row_id < row_id.value:
+            row_id, payload = self._read_cell(data, cell_pointers[mid])
+
+            if target_row_id == row_id:
+                return (row_id, payload)
+            elif target_row_id < row_id:
                 right = mid - 1
             else:
                 left = mid + 1
 
-    def _full_scan(self, page: Page):
-        records = []
-        for cell_pointer in page.cell_pointers:
-            record_size = page.get_record_size(cell_pointer)
-            row_id = page.get_row_id(cell_pointer)
-
-            offset = cell_pointer + record_size.bytes_length + row_id.bytes_length
-            data = page.data[offset : offset + record_size.value]
+    def _full_scan(self, page: Page) -> Iterator[tuple[int, memoryview]]:
+        # Cells are decoded lazily, as the caller consumes them,
+        # instead of building up a list for the whole page first
+        data, read_cell = page.data, self._read_cell
+        return (read_cell(data, cell_pointer) for cell_pointer in page.cell_pointers)
 
-            records.append((row_id.value, data))
-        return records
+    def _read_cell(self, data: memoryview, cell_pointer: int) -> tuple[int, memoryview]:
+        # A table leaf cell starts with the record size, followed by the rowid
+        # and then the record itself. We walk it with a running offset so
+        # that only the final payload gets sliced out of the page, and since
+        # the page is a memoryview even that slice is just a view.
+        record_size, offset = Varint.decode(data, cell_pointer)
+        row_id, offset = Varint.decode_signed(data, offset)
+        return row_id, data[offset : offset + record_size]
 
 
 class IndexSearcher(BTreeWalker[list[int]]):
+    __slots__ = ("database", "search_key")
+
     def __init__(self, database: Database, search_key: bytes):
         self.database = database
         self.search_key = search_key
@@ -62,111 +72,82 @@ class IndexSearcher(BTreeWalker[list[int]]):
         """
         Search leaf page for matching key.
         """
-        records = []
-        with self.database.reader() as f:
-            for cell_pointer in page.cell_pointers:
-                # Position at start of cell content
-                f.seek(self.database.page_size * page.page_number + cell_pointer)
+        return self._collect_matches(page)
 
-                # Read payload size varint
-                payload_size = Varint.from_data(f)
+    def visit_interior(self, page: Page) -> list[int]:
+        # Interior index cells also hold entries, so they can match too
+        return self._collect_matches(page)
 
-                # Read key data
-                key_record = f.read(payload_size.value)
-                key, rowid = self._parse_key_record(key_record)
+    def choose_paths(self, page: Page) -> list[int]:
+        """
+        Determine which child pages to follow by comparing keys.
+        """
+        cell_pointers, search_key = page.cell_pointers, self.search_key
 
-                if self.search_key == key:
-                    records.append(rowid)
+        # Every left child up to and including the last key equal to our
+        # search key may hold matches, as well as the child right after it
+        key = self._key_reader(page)
+        lo = bisect_left(cell_pointers, search_key, key=key)
+        hi = bisect_right(cell_pointers, search_key, lo=lo, key=key)
 
-                # Index entries are sorted, so we can stop if we've gone too far
-                if key > self.search_key:
-                    break
+        paths = list(range(lo, hi))
+        # If there's no larger key on this page, follow the rightmost pointer
+        paths.append(hi if hi < len(cell_pointers) else -1)
 
-        return records
+        return paths
 
-    def visit_interior(self, page: Page) -> list[int]:
+    def _collect_matches(self, page: Page) -> list[int]:
         records = []
-        with self.database.reader() as f:
-            for cell_pointer in page.cell_pointers:
-                f.seek(self.database.page_size * page.page_number + cell_pointer)
-                f.read(4)  # Skip child pointer
-                payload_size = Varint.from_data(f).value
-                key_record = f.read(payload_size)
-                key, rowid = self._parse_key_record(key_record)
-
-                if key == self.search_key:
-                    records.append(rowid)
-                elif key > self.search_key:
-                    break
+        cell_pointers, search_key = page.cell_pointers, self.search_key
+
+        # Index entries are sorted, so we can binary search for the first
+        # match and then collect the duplicates that follow it
+        idx = bisect_left(cell_pointers, search_key, key=self._key_reader(page))
+        for cell_pointer in cell_pointers[idx:]:
+            key, rowid = self._read_key_at(page, cell_pointer)
+            if key != search_key:
+                break
+            records.append(rowid)
 
         return records
 
-    def choose_paths(self, page: Page) -> list[int]:
-        """
-        Determine which child pages to follow by comparing keys.
-        """
-        paths = []
-        found_larger = False
-
-        with self.database.reader() as f:
-            keys = []
-            for i, cell_pointer in enumerate(page.cell_pointers):
-                f.seek(self.database.page_size * page.page_number + cell_pointer)
-                f.read(4)  # Skip child pointer
-                payload_size = Varint.from_data(f).value
-                key_record = f.read(payload_size)
-                key, _ = self._parse_key_record(key_record)
-                keys.append(key)
-
-        if self.search_key < keys[0]:
-            return [0]
-        if self.search_key > keys[-1]:
-            return [-1]
-
-        # Now analyze the keys
-        for i, key in enumerate(keys):
-            if key > self.search_key:
-                paths.append(i)
-                found_larger = True
-                break
-            elif self.search_key == key:
-                paths.append(i)
+    def _key_reader(self, page: Page) -> Callable[[int], bytes]:
+        # Lets bisect compare against cell keys directly, so we only
+        # parse the O(log n) cells the search actually lands on
+        return lambda cell_pointer: self._read_key_at(page, cell_pointer)[0]
 
-        # If we haven't found a larger key, follow rightmost pointer
-        if not found_larger:
-            paths.append(-1)
+    def _read_key_at(self, page: Page, cell_pointer: int) -> tuple[bytes, int]:
+        # The whole page is already in memory, so parse the cell straight
+        # out of it instead of going back to the database file
+        offset = cell_pointer
+        if page.type == PageType.INTERIOR_INDEX_B_TREE:
+            offset += 4  # Skip child pointer
 
-        return paths
+        # Read payload size varint, then the key record itself
+        payload_size, offset = Varint.decode(page.data, offset)
+        key_record = page.data[offset : offset + payload_size]
+        return self._parse_key_record(key_record)
 
-    def _parse_key_record(self, key_record: bytes) -> tuple[bytes, int]:
+    def _parse_key_record(self, key_record: memoryview) -> tuple[bytes, int]:
         # The key payload is in record format, so we need to parse it.
         # First is the record header, which gives us the total
-        # number of bytes in the header
-        record_header = Varint.from_data(key_record)
-        offset = record_header.bytes_length
+        # number of bytes in the header (including this varint)
+        header_size, offset = Varint.decode(key_record)
 
         # The next pieces are varints describing the column types
-        # and their sizes
+        # and their sizes, which we walk with a running offset
         serial_types = []
-        total_bytes_read = 0
-        while total_bytes_read < record_header.value:
-            piece = key_record[offset + total_bytes_read - 1 :]
-            serial_type_varint = Varint.from_data(piece)
-            total_bytes_read += serial_type_varint.bytes_length
-            serial_types.append(SQLiteSerialType.decode(serial_type_varint.value))
-
-        offset = 0
-        bytes_length = serial_types[0][1]
-        # What is this? Not sure
-        _ = key_record[offset : offset + bytes_length]
+        while offset < header_size:
+            serial_type, offset = Varint.decode(key_record, offset)
+            serial_types.append(serial_type)
+
+        # Index records hold the indexed column followed by the rowid
+        offset = header_size
+        _, bytes_length = SQLiteSerialType.decode(serial_types[0])
+        # Memoryviews don't support ordering, so copy out the (short) key
+        key = bytes(key_record[offset : offset + bytes_length])
         offset += bytes_length
 
-        bytes_length = serial_types[1][1]
-        key = key_record[offset : offset + bytes_length]
-        offset += bytes_length
-
-        bytes_length = serial_types[2][1]
-        rowid = int.from_bytes(key_record[offset : offset + bytes_length])
+        rowid = SQLiteSerialType.read_integer(serial_types[-1], key_record, offset)
 
-        offset += bytes_length
         return key, rowid
@@ -1,21 +1,66 @@
-from contextlib import contextmanager
-from io import BufferedReader
-from typing import Generator
+import mmap
+from collections import OrderedDict
+from functools import cached_property
+from struct import Struct
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .page import Page
+    from .records import SqliteSchemaRecord
+
+_unpack_u16 = Struct(">H").unpack_from
 
 
 class Database:
-    def __init__(self, path: str):
+    def __init__(self, path: str, page_cache_size: int = 1024):
         self.path = path
-        with self.reader() as f:
-            self.page_size = self._get_page_size(f)
-
-    @contextmanager
-    def reader(self) -> Generator[BufferedReader, None, None]:
-        with open(self.path, "rb") as f:
-            yield f
-
-    def _get_page_size(self, f: BufferedReader) -> int:
-        # Skip the first 16 bytes of the header
-        f.seek(16)
-        # The next 2 bytes represent the DB's page size
-        return int.from_bytes(f.read(2), byteorder="big")
+        # Map the whole file into memory so pages can be sliced out
+        # of it directly, without a seek + read syscall pair per access.
+        # We hold on to the file until we're closed
+        self._file = open(path, "rb")
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_RANDOM"):
+            # B-tree walks jump around the file, so readahead is wasted work
+            self.mm.madvise(mmap.MADV_RANDOM)
+        # Slicing a memoryview over the map hands out views, not copies
+        self._view = memoryview(self.mm)
+
+        # Skip the first 16 bytes of the header,
+        # the next 2 bytes represent the DB's page size
+        self.page_size = _unpack_u16(self._view, 16)[0]
+
+        # The file is read-only for us, so decoded pages never go stale.
+        # Entries are kept in least-recently-used order for eviction.
+        self.page_cache: OrderedDict[int, "Page"] = OrderedDict()
+        self.page_cache_size = page_cache_size
+
+    @cached_property
+    def schema_records(self) -> list["SqliteSchemaRecord"]:
+        # Both modules depend on this one, so we import them lazily
+        from .page import Page
+        from .records import RecordFormat, SqliteSchemaRecord
+
+        # The sqlite_schema table is rooted at the first page
+        page = Page.get_page(self, 0)
+        return [
+            SqliteSchemaRecord.from_record(r)
+            for r in RecordFormat.get_records(self, page)
+        ]
+
+    @cached_property
+    def schema(self) -> dict[tuple[str, str], "SqliteSchemaRecord"]:
+        # Schema records by (type, name), e.g. ("table", "apples")
+        # or ("index", "idx_companies_country"), for O(1) lookups
+        return {
+            (record.record_type, record.name): record for record in self.schema_records
+        }
+
+    def read(self, offset: int, size: int) -> memoryview:
+        return self._view[offset : offset + size]
+
+    def close(self):
+        # Cached pages hold views into the map, which must be gone before closing it
+        self.page_cache.clear()
+        self._view.release()
+        self.mm.close()
+        self._file.close()
@@ -1,31 +1,118 @@
+import operator
+import re
 import sys
+from typing import Any, Callable
 
 
 from .database import Database
 from .btree import IndexSearcher, RecordCollector, CellCounter
 from .page import Page, search_index, walk_btree
-from .records import RecordFormat, UserTableRecord, SqliteSchemaRecord
+from .records import UserTableRecord
 from .sql import SQL
 
 
-def _get_records_for_sqlite_schema_table(
-    database: Database,
-) -> list[SqliteSchemaRecord]:
-    page = Page.get_page(database, 0)
-    if not page:
-        raise Exception("Expected root page to exist")
+def _to_text(value: Any) -> str:
+    # Like the sqlite3 shell, NULLs show up as empty strings
+    return "" if value is None else str(value)
 
-    return [
-        SqliteSchemaRecord.from_record(r)
-        for r in RecordFormat.get_records(database, page)
-    ]
+
+_ORDERINGS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _predicate(op: str, value: str) -> Callable[[Any], bool]:
+    # The comparison only depends on the query, so we work out how to
+    # check it once and hand back a function to run against column values.
+    # Like in SQLite, comparing anything with NULL is never true
+    if op == "like":
+        # % matches any run of characters and _ any single one
+        pattern = re.compile(
+            "".join(
+                ".*" if char == "%" else "." if char == "_" else re.escape(char)
+                for char in value
+            ),
+            re.IGNORECASE | re.DOTALL,
+        )
+        return lambda column_value: (
+            column_value is not None
+            and pattern.fullmatch(str(column_value)) is not None
+        )
+
+    if op in _ORDERINGS:
+        compare = _ORDERINGS[op]
+        number = _to_number(value)
+        text = value.lower()
+
+        def check(column_value: Any) -> bool:
+            if column_value is None:
+                return False
+            # Numbers compare as numbers, everything else as text
+            if number is not None and isinstance(column_value, (int, float)):
+                return compare(column_value, number)
+            return compare(str(column_value).lower(), text)
+
+        return check
+
+    text = value.lower()
+    if op == "=":
+        return lambda column_value: (
+            column_value is not None and str(column_value).lower() == text
+        )
+    # != and <>
+    return lambda column_value: (
+        column_value is not None and str(column_value).lower() != text
+    )
+
+
+def _to_number(value: str) -> int | float | None:
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _to_row_id(value: str | None) -> int | None:
+    # Rowids are integers, so anything else can't be seeked to
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _row_formatter(column_idxs: list[int]) -> Callable[[tuple[Any, ...]], str]:
+    # The output columns are fixed for the whole query, so we pick
+    # the cheapest way to format a row for them up front, rather than
+    # looping over the columns again for every row
+    if not column_idxs:
+        return lambda _: ""
+    if len(column_idxs) == 1:
+        (column_idx,) = column_idxs
+        return lambda record: _to_text(record[column_idx])
+
+    get_values = operator.itemgetter(*column_idxs)
+    return lambda record: "|".join(map(_to_text, get_values(record)))
 
 
 def main():
     database_file_path = sys.argv[1]
     command = sys.argv[2].lower()
     database = Database(database_file_path)
+    run_command(database, command)
+    # Nothing we decoded holds on to the pages anymore, so we can let go of the file
+    database.close()
 
+
+def run_command(database: Database, command: str):
     if command == ".dbinfo":
         page = Page.get_page(database, 0)
         print(f"database page size: {database.page_size}")
@@ -34,22 +121,14 @@ def main():
         # so the SQLite schema table only contains references to other tables.
         print(f"number of tables: {page.cell_count}")
     elif command == ".tables":
-        records = _get_records_for_sqlite_schema_table(database)
-        table_names = [record.table_name for record in records]
+        table_names = [record.table_name for record in database.schema_records]
         table_names.sort()
         print(" ".join(table_names))
     elif command.upper().startswith("SELECT "):
         user_command_sql = SQL.from_query(command)
 
         # Get the schema record corresponding to the table we're looking up
-        sqlite_schema_records = _get_records_for_sqlite_schema_table(database)
-        table_record = next(
-            (
-                record
-                for record in sqlite_schema_records
-                if record.table_name == user_command_sql.table
-            )
-        )
+        table_record = database.schema[("table", user_command_sql.table)]
         # rootpage is 1-indexed, so we need to subtract 1 to get to the correct page
         page_number = int.from_bytes(table_record.rootpage, byteorder="big") - 1
 
@@ -66,22 +145,35 @@ def main():
             # the available columns and their ordering
             create_query = SQL.from_query(table_record.sql)
 
-            # Is there filtering going on?
+            # Is there filtering going on? Only equality comparisons can be
+            # answered by seeking, the rest get checked for every record
+            where = user_command_sql.where
+            # Keep the first equality comparison on each column around
+            equals = {}
+            for comparison in where:
+                if comparison[1] == "=":
+                    equals.setdefault(comparison[0], comparison)
+
             idxs = []
-            if user_command_sql.where and "country" in user_command_sql.where.keys():
+            # Only seek if the table declares a rowid alias we're comparing against
+            row_id_column = create_query.row_id_column
+            seek_comparison = equals.get(row_id_column) if row_id_column else None
+            row_id = _to_row_id(seek_comparison[2]) if seek_comparison else None
+            if row_id is None:
+                # Not a rowid, so it gets checked like any other comparison
+                seek_comparison = None
+
+            if row_id is not None:
+                # The column is an alias for the rowid, so we can seek
+                # straight to that row in the table b-tree instead of scanning it
+                idxs = [row_id]
+            elif "country" in equals:
                 # Let's look for an index we can use
-                index_record = next(
-                    (
-                        record
-                        for record in sqlite_schema_records
-                        if record.record_type == "index"
-                        and record.name == "idx_companies_country"
-                    )
-                )
+                index_record = database.schema[("index", "idx_companies_country")]
                 index_root_page = Page.get_page(
                     database, int.from_bytes(index_record.rootpage) - 1
                 )
-                key = user_command_sql.where["country"].encode()
+                key = equals["country"][2].encode()
                 idxs = [
                     idx
                     for idxs in search_index(
@@ -92,72 +184,73 @@ def main():
                     for idx in idxs
                 ]
 
+            # Build a check for every comparison and apply our where clause to
+            # filter out records, decoding only the compared columns, so that
+            # rejected records never get fully materialized.
+            # The rowid is already taken care of if we're seeking to it
+            comparisons = []
+            for comparison in where:
+                col, op, value = comparison
+                if col in create_query.columns and comparison is not seek_comparison:
+                    read_column = UserTableRecord.column_reader(
+                        create_query.columns, col, row_id_column
+                    )
+                    comparisons.append((read_column, _predicate(op, value)))
+
+            # Records are all decoded against the same table columns
+            parse_layout = UserTableRecord.parse_layout
+            decode_row = UserTableRecord.row_decoder(
+                create_query.columns, row_id_column
+            )
+
             records = []
+
+            def collect(row_id: int, row: memoryview):
+                # The record header is only parsed once, for both
+                # the WHERE checks and decoding the whole row
+                layout = parse_layout(row)
+                if all(
+                    check(read_column(row_id, row, layout))
+                    for read_column, check in comparisons
+                ):
+                    records.append(decode_row(row_id, row, layout))
+
             if idxs:
                 # Retrieve the data records for our lookup table using the index
                 for target_row_id in sorted(idxs):
-                    for row_id, row in walk_btree(
+                    for cell in walk_btree(
                         root_page,
                         database,
                         RecordCollector(target_row_id),
                         target_row_id,
                     ):
-                        records.append(
-                            UserTableRecord.from_record(
-                                row_id, row, table_columns=create_query.columns
-                            )
-                        )
+                        # There might not be a row with the rowid we're after
+                        if cell is None:
+                            continue
+                        collect(*cell)
             else:
                 # Retrieve the data records for our lookup table using a full-table scan
-                records = [
-                    UserTableRecord.from_record(
-                        row_id, row, table_columns=create_query.columns
-                    )
-                    for records in walk_btree(
-                        root_page,
-                        database,
-                        RecordCollector(),
-                    )
-                    for row_id, row in records
-                ]
+                for cells in walk_btree(root_page, database, RecordCollector()):
+                    for row_id, row in cells:
+                        collect(row_id, row)
 
-            # Print out the values for the lookup column
-            for record in records:
-                column_values = {col: record[col] for col in create_query.columns}
-                # Compute any comparison and apply our where clause
-                # to filter out records
-                if not idxs:
-                    comparisons = {
-                        col: user_command_sql.where.get(col)
-                        for col in create_query.columns
-                    }
-                    pairs = zip(column_values.values(), comparisons.values())
-                    if any(
-                        comparison is not None and value.lower() != comparison.lower()
-                        for value, comparison in pairs
-                    ):
-                        continue
-
-                # Keep things sorted as specified in the user command SQL
-                def _find(l: list, value: str) -> int:
-                    try:
-                        return l.index(value)
-                    except ValueError:
-                        return -1
-
-                sorted_columns = sorted(
-                    column_values.items(),
-                    key=lambda column: _find(user_command_sql.columns, column[0]),
-                )
+            # The columns to print only depend on the query, so work them out
+            # once: the ones specified in the user command SQL that the table has,
+            # in the order the user command SQL first asks for them. Records are
+            # tuples in table column order, so we keep the column positions
+            column_idxs = {col: idx for idx, col in enumerate(create_query.columns)}
+            output_column_idxs = [
+                column_idxs[col]
+                for col in dict.fromkeys(user_command_sql.columns)
+                if col in column_idxs
+            ]
 
-                # Join the column values and print them out,
-                # if they are specified in the user command SQL
-                line = "|".join(
-                    str(column_value)
-                    for column_name, column_value in sorted_columns
-                    if column_name in user_command_sql.columns
-                )
-                print(line)
+            # Join the column values of every record, and write all the lines
+            # out at once instead of going through print() for each row
+            format_row = _row_formatter(output_column_idxs)
+            lines = [format_row(record) for record in records]
+            if lines:
+                sys.stdout.write("\n".join(lines) + "\n")
 
     else:
         print(f"Invalid command: {command}")
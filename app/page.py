@@ -1,4 +1,8 @@
+import sys
+from array import array
+from bisect import bisect_left
 from enum import Enum
+from struct import Struct
 from typing import Generator, Self, TypeVar, Protocol
 
 from app.varint import Varint
@@ -7,6 +11,9 @@ from .database import Database
 
 T = TypeVar("T", covariant=True)
 
+_unpack_u16 = Struct(">H").unpack_from
+_unpack_u32 = Struct(">I").unpack_from
+
 
 class PageType(Enum):
     INTERIOR_INDEX_B_TREE = 0x02
@@ -15,80 +22,84 @@ class PageType(Enum):
     LEAF_TABLE_B_TREE = 0x0D
 
 
+# Looking the page type up by its flag byte is a lot cheaper
+# than calling the enum, which we would otherwise do for every page
+_PAGE_TYPES = {page_type.value: page_type for page_type in PageType}
+
+
 class Page:
-    def __init__(self, data: bytes, page_number: int):
+    # Pages are created for every node we visit, so keep them free of a __dict__.
+    # The derived fields that are only decoded on first use get their own slots.
+    __slots__ = (
+        "data",
+        "page_number",
+        "header_offset",
+        "type",
+        "is_leaf",
+        "cell_count",
+        "header_size",
+        "rightmost_pointer",
+        "_cell_pointers",
+        "_child_pointers",
+        "_row_ids",
+    )
+
+    def __init__(self, data: bytes | memoryview, page_number: int):
+        # We hold on to the whole page, so that cell pointers (which are
+        # relative to the start of the page) can index straight into it
         self.data = data
         self.page_number = page_number
 
+        # On the first page, the b-tree page header comes after the file header
+        self.header_offset = 100 if page_number == 0 else 0
+        header_offset = self.header_offset
+
         # The one-byte flag at offset 0 indicating the b-tree page type.
-        self.type = PageType(data[0])
+        page_type = _PAGE_TYPES.get(data[header_offset])
+        if page_type is None:
+            raise ValueError(f"{data[header_offset]} is not a valid PageType")
+        self.type = page_type
+        # Both leaf page types (0x0A and 0x0D) have bit 3 set in their flag,
+        # and neither interior type (0x02 and 0x05) does
+        self.is_leaf = bool(data[header_offset] & 0x08)
+
+        # The two-byte integer at offset 3 gives the number of cells on the page.
+        self.cell_count = _unpack_u16(data, header_offset + 3)[0]
 
         # The b-tree page header is 8 bytes in size for
         # leaf pages and 12 bytes for interior pages.
-        self.header_size = (
-            8
-            if self.type in (PageType.LEAF_TABLE_B_TREE, PageType.LEAF_INDEX_B_TREE)
-            else 12
-        )
+        self.header_size = 8 if self.is_leaf else 12
 
         # The four-byte page number at offset 8 is the right-most pointer.
         # This value appears in the header of interior b-tree pages only
         # and is omitted from all other pages.
         self.rightmost_pointer = (
-            int.from_bytes(data[8:12], byteorder="big")
-            if self.type
-            in (PageType.INTERIOR_TABLE_B_TREE, PageType.INTERIOR_INDEX_B_TREE)
-            else None
+            None if self.is_leaf else _unpack_u32(data, header_offset + 8)[0]
         )
 
+        self._cell_pointers: array | None = None
+        self._child_pointers: list[int] | None = None
+        self._row_ids: dict[int, int] | None = None
+
     @classmethod
     def get_page(cls, database: Database, page_number: int) -> Self:
-        with database.reader() as f:
-            # If we're on the first page, skip the file header
-            offset = 100 if page_number == 0 else database.page_size * page_number
-            f.seek(offset)
-
-            data = f.read(database.page_size)
-            return cls(data, page_number)
-
-    def get_child_pointer(self, cell_pointer: int) -> int:
-        # The format of a cell depends on which kind of b-tree page the cell appears on...
-        # For Table B-Tree Interior Cells, the first piece of information
-        # is a 4-byte big-endian page number which is the left child pointer.
-        if not self.type in (
-            PageType.INTERIOR_TABLE_B_TREE,
-            PageType.INTERIOR_INDEX_B_TREE,
-        ):
-            raise Exception("Trying to get child pointer on leaf page!")
-        return int.from_bytes(self.data[cell_pointer : cell_pointer + 4])
-
-    def get_row_id(self, cell_pointer: int) -> Varint:
-        # On interior table pages, after the child pointer we have
-        # a varint which is the integer key, aka "rowid" or "row_id"
-        if self.type == PageType.INTERIOR_TABLE_B_TREE:
-            return Varint.from_data(self.data[cell_pointer + 4 :])
-        # For table leaf pages, we need to grab it after the record size
-        if self.type == PageType.LEAF_TABLE_B_TREE:
-            record_size = self.get_record_size(cell_pointer)
-            return Varint.from_data(
-                self.data[cell_pointer + record_size.bytes_length :]
-            )
-        else:
-            raise Exception("Trying to get row_id on non-table page")
+        # Interior pages get revisited on every descent,
+        # so serve them from the page cache if we can
+        page = database.page_cache.get(page_number)
+        if page is not None:
+            database.page_cache.move_to_end(page_number)
+            return page
 
-    def get_record_size(self, cell_pointer: int) -> Varint:
-        # This is the first piece of information in cells for leaf pages
-        if self.type not in (PageType.LEAF_TABLE_B_TREE, PageType.LEAF_INDEX_B_TREE):
-            raise Exception("Only leaf cells have a record size")
-        return Varint.from_data(self.data[cell_pointer:])
+        offset = database.page_size * page_number
+        page = cls(database.read(offset, database.page_size), page_number)
 
-    @property
-    def cell_count(self) -> int:
-        # The two-byte integer at offset 3 gives the number of cells on the page.
-        return int.from_bytes(self.data[3:5], byteorder="big")
+        database.page_cache[page_number] = page
+        if len(database.page_cache) > database.page_cache_size:
+            database.page_cache.popitem(last=False)
+        return page
 
     @property
-    def cell_pointers(self) -> list[int]:
+    def cell_pointers(self) -> array:
         # The cell pointer array of a b-tree page immediately
         # follows the b-tree page header.
         #
@@ -98,19 +109,69 @@ class Page:
         # The cell pointers are arranged in key order with
         # the left-most cell (the cell with the smallest key) first
         # and the right-most cell (the cell with the largest key) last.
-        pointers = []
-        for i in range(self.cell_count):
-            start = self.header_size + i * 2
-            end = self.header_size + (i + 1) * 2
-            pointer = int.from_bytes(
-                self.data[start:end],
-                byteorder="big",
-            )
-            pointers.append(pointer)
-        return pointers
+        #
+        # We decode them once, on first use (a count(*) never needs them),
+        # straight into a compact array of unsigned shorts, fixing up
+        # the byte order if our host isn't big-endian.
+        cell_pointers = self._cell_pointers
+        if cell_pointers is None:
+            start = self.header_offset + self.header_size
+            cell_pointers = array("H")
+            cell_pointers.frombytes(self.data[start : start + self.cell_count * 2])
+            if sys.byteorder == "little":
+                cell_pointers.byteswap()
+            self._cell_pointers = cell_pointers
+        return cell_pointers
+
+    @property
+    def child_pointers(self) -> list[int]:
+        # The left child pointer of every cell on an interior page, in cell order.
+        # Unpacking them straight from the buffer avoids a slice per cell.
+        if self.rightmost_pointer is None:
+            raise Exception("Trying to get child pointers on leaf page!")
+        child_pointers = self._child_pointers
+        if child_pointers is None:
+            data = self.data
+            child_pointers = [
+                _unpack_u32(data, cell_pointer)[0]
+                for cell_pointer in self.cell_pointers
+            ]
+            self._child_pointers = child_pointers
+        return child_pointers
+
+    def get_cached_row_id(self, cell_pointer: int) -> int:
+        # Looking up a batch of rowids descends through the same interior
+        # pages over and over, landing on a lot of the same cells, so we
+        # remember the rowids we've decoded. Only the O(log n) cells
+        # a binary search looks at ever get decoded
+        row_ids = self._row_ids
+        if row_ids is None:
+            row_ids = self._row_ids = {}
+        row_id = row_ids.get(cell_pointer)
+        if row_id is None:
+            row_id = row_ids[cell_pointer] = self.get_row_id(cell_pointer)
+        return row_id
+
+    def get_row_id(self, cell_pointer: int) -> int:
+        # On interior table pages, after the child pointer we have
+        # a varint which is the integer key, aka "rowid" or "row_id"
+        if self.type == PageType.INTERIOR_TABLE_B_TREE:
+            row_id, _ = Varint.decode_signed(self.data, cell_pointer + 4)
+            return row_id
+        # For table leaf pages, we need to grab it after the record size
+        if self.type == PageType.LEAF_TABLE_B_TREE:
+            _, offset = Varint.decode(self.data, cell_pointer)
+            row_id, _ = Varint.decode_signed(self.data, offset)
+            return row_id
+        else:
+            raise Exception("Trying to get row_id on non-table page")
 
 
 class BTreeWalker(Protocol[T]):
+    # Walkers are created per query and touch their attributes on every cell,
+    # so subclasses declare __slots__ and this keeps them free of a __dict__
+    __slots__ = ()
+
     def visit_leaf(self, page: Page) -> T:
         "Process a leaf page and return a result"
         pass
@@ -139,68 +200,79 @@ def walk_btree(
     if result is not None:
         yield result
 
-    if target_row_id:
+    if target_row_id is not None:
         # Index scan
-
-        # First we check the lower and upper bounds
-        first_cell_pointer = page.cell_pointers[0]
-        first_row_id = page.get_row_id(first_cell_pointer)
-
-        last_cell_pointer = page.cell_pointers[-1]
-        last_row_id = page.get_row_id(last_cell_pointer)
-
-        # If our target is larger than the last rowid on this node,
-        # we need to use the rightmost pointer
-        if target_row_id > last_row_id.value:
-            if page.rightmost_pointer:
-                rightmost_page = Page.get_page(database, page.rightmost_pointer - 1)
-                yield from walk_btree(rightmost_page, database, walker, target_row_id)
-                return
-        # If our target is smaller than the first rowid on this node,
-        # we need to use the leftmost pointer
-        elif target_row_id < first_row_id.value:
-            left_child_pointer = page.get_child_pointer(first_cell_pointer)
-            leftmost_page = Page.get_page(database, left_child_pointer - 1)
-            yield from walk_btree(leftmost_page, database, walker, target_row_id)
-            return
-        else:
-            # If our target is in between our bounds,
-            # let's use binary search to find the
-            # leaf page we're interested in
-            left, right = 0, page.cell_count - 1
-            next_page_number = -1
-
-            while left <= right:
-                mid = (left + right) // 2
-
-                cell_pointer = page.cell_pointers[mid]
-                row_id = page.get_row_id(cell_pointer)
-
-                if target_row_id <= row_id.value:
-                    right = mid - 1
-                    left_child_pointer = page.get_child_pointer(cell_pointer)
-                    next_page_number = left_child_pointer - 1
-                else:
-                    left = mid + 1
-                    cell_pointer = page.cell_pointers[left]
-                    right_child_pointer = page.get_child_pointer(cell_pointer)
-                    next_page_number = right_child_pointer - 1
-
-            next_page = Page.get_page(database, next_page_number)
-            yield from walk_btree(next_page, database, walker, target_row_id)
+        yield from _seek_row_id(page, database, walker, target_row_id)
     else:
         # Full-table scan
+        yield from _scan_children(page, database, walker)
+
+
+def _seek_row_id(
+    page: Page, database: Database, walker: BTreeWalker[T], target_row_id: int
+) -> Generator[T, None, None]:
+    # A rowid seek follows a single path from the root down to a leaf,
+    # so we can simply loop one level at a time instead of recursing
+    while True:
+        # Interior cells are sorted by rowid, and each left child holds the
+        # rows up to and including its cell's rowid. So we binary search for
+        # the first cell whose rowid isn't smaller than our target: its left
+        # child is the one to descend into. If every rowid on this node is
+        # smaller, we need to use the rightmost pointer
+        cell_pointers = page.cell_pointers
+        idx = bisect_left(cell_pointers, target_row_id, key=page.get_cached_row_id)
+        if idx < len(cell_pointers):
+            # Interior cells start with the 4-byte left child pointer,
+            # and we only need the one we're descending into
+            next_page_number = _unpack_u32(page.data, cell_pointers[idx])[0] - 1
+        elif page.rightmost_pointer:
+            next_page_number = page.rightmost_pointer - 1
+        else:
+            return
 
-        # Traverse through all the left pointers
-        for cell_pointer in page.cell_pointers:
-            left_child_pointer = page.get_child_pointer(cell_pointer)
-            child_page = Page.get_page(database, left_child_pointer - 1)
-            yield from walk_btree(child_page, database, walker, target_row_id)
+        page = Page.get_page(database, next_page_number)
+
+        # Process leaf nodes
+        if page.type == PageType.LEAF_TABLE_B_TREE:
+            yield walker.visit_leaf(page)
+            return
 
-        # Finally, traverse through the right pointer
-        if page.rightmost_pointer:
-            rightmost_page = Page.get_page(database, page.rightmost_pointer - 1)
-            yield from walk_btree(rightmost_page, database, walker, target_row_id)
+        # Optionally process interior nodes
+        result = walker.visit_interior(page)
+        if result is not None:
+            yield result
+
+
+def _scan_children(
+    page: Page, database: Database, walker: BTreeWalker[T]
+) -> Generator[T, None, None]:
+    # Rather than recursing (and passing every result up through one
+    # generator per tree level), we keep an explicit stack of the
+    # page numbers we still have to visit, in the order we'll visit them
+    stack = _child_page_numbers(page)
+    while stack:
+        page = Page.get_page(database, stack.pop())
+
+        # Process leaf nodes
+        if page.type == PageType.LEAF_TABLE_B_TREE:
+            yield walker.visit_leaf(page)
+            continue
+
+        # Optionally process interior nodes
+        result = walker.visit_interior(page)
+        if result is not None:
+            yield result
+
+        stack.extend(_child_page_numbers(page))
+
+
+def _child_page_numbers(page: Page) -> list[int]:
+    # Children are returned right to left, so that popping them off a stack
+    # traverses all the left pointers first and the right pointer last.
+    # Child pointers are 1-indexed, so we subtract 1 to get page numbers.
+    page_numbers = [page.rightmost_pointer - 1] if page.rightmost_pointer else []
+    page_numbers.extend(pointer - 1 for pointer in reversed(page.child_pointers))
+    return page_numbers
 
 
 def search_index(
@@ -209,29 +281,29 @@ def search_index(
     """
     Search a B-tree index structure.
     """
-    result = None
-    if page.type == PageType.LEAF_INDEX_B_TREE:
-        result = walker.visit_leaf(page)
-        yield result
-        return
-
-    if result := walker.visit_interior(page):
-        yield result
-
-    child_idxs = walker.choose_paths(page)
-
-    for child_idx in child_idxs:
-        if child_idx == -1:
-            if not page.rightmost_pointer:
-                raise ValueError("Expected rightmost pointer in interior index page")
-            child_page = Page.get_page(database, page.rightmost_pointer - 1)
-        else:
-            cell_pointer = page.cell_pointers[child_idx]
-            with database.reader() as database_file:
-                database_file.seek(database.page_size * page.page_number + cell_pointer)
-                left_child_pointer = int.from_bytes(
-                    database_file.read(4), byteorder="big"
-                )
-            child_page = Page.get_page(database, left_child_pointer - 1)
-
-        yield from search_index(child_page, database, walker)
+    # Like full-table scans, we keep an explicit stack of the pages
+    # still to visit instead of recursing into every child we follow
+    stack = [page]
+    while stack:
+        page = stack.pop()
+        if page.type == PageType.LEAF_INDEX_B_TREE:
+            yield walker.visit_leaf(page)
+            continue
+
+        if result := walker.visit_interior(page):
+            yield result
+
+        child_pages = []
+        for child_idx in walker.choose_paths(page):
+            if child_idx == -1:
+                if not page.rightmost_pointer:
+                    raise ValueError(
+                        "Expected rightmost pointer in interior index page"
+                    )
+                child_page_number = page.rightmost_pointer - 1
+            else:
+                child_page_number = page.child_pointers[child_idx] - 1
+            child_pages.append(Page.get_page(database, child_page_number))
+
+        # Pushed in reverse, so the children are visited in the order chosen
+        stack.extend(reversed(child_pages))
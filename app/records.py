@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Any
+from itertools import accumulate, pairwise
+from typing import Any, Callable, Sequence
 
 from .serial_type import SQLiteSerialType
 from .varint import Varint
@@ -10,22 +11,22 @@ from .page import Page
 @dataclass
 class RecordFormat:
     @classmethod
-    def get_records(cls, database: Database, page: Page) -> list[bytes]:
+    def get_records(cls, database: Database, page: Page) -> list[memoryview]:
         records = []
-        with database.reader() as database_file:
-            for cell_pointer in page.cell_pointers:
-                database_file.seek(database.page_size * page.page_number + cell_pointer)
-                # The first relevant information in the cell is a varint that describes the record's size
-                record_size_varint = Varint.from_data(database_file)
-                # The second information is the rowid, also a varint - irrelevant for us now
-                _rowid_varint = Varint.from_data(database_file)
-                # The third information is the actual record
-                data = database_file.read(record_size_varint.value)
-                records.append(data)
+        data = page.data
+        for cell_pointer in page.cell_pointers:
+            # The first relevant information in the cell is a varint that describes the record's size
+            record_size, offset = Varint.decode(data, cell_pointer)
+            # The second information is the rowid, also a varint - irrelevant for us now
+            _rowid, offset = Varint.decode(data, offset)
+            # The third information is the actual record
+            records.append(data[offset : offset + record_size])
         return records
 
     @classmethod
-    def parse_header(cls, data: bytes) -> tuple[int, list[tuple[str, int]]]:
+    def parse_header(
+        cls, data: bytes | memoryview
+    ) -> tuple[int, list[tuple[int, int]]]:
         """
         The header begins with a single varint which determines the total number of bytes in the header.
         The varint value is the size of the header in bytes including the size varint itself.
@@ -37,21 +38,18 @@ class RecordFormat:
 
         https://www.sqlite.org/fileformat.html#record_format
         """
-        offset = 0
         # First piece of information is the record header size
-        record_header = Varint.from_data(data)
-        offset += record_header.bytes_length
+        header_size, offset = Varint.decode(data)
 
         serial_types = []
-        # The next pieces are varints describing the column types and sizes
-        total_bytes_read = 0
-        while total_bytes_read < record_header.value - 1:
-            piece = data[offset + total_bytes_read :]
-            serial_type_varint = Varint.from_data(piece)
-            total_bytes_read += serial_type_varint.bytes_length
-            serial_types.append(SQLiteSerialType.decode(serial_type_varint.value))
-
-        offset += total_bytes_read
+        # The next pieces are varints describing the column types and sizes.
+        # We decode them in place with a running offset rather than
+        # slicing off the rest of the record for every one of them, and
+        # keep each type code along with the size of its value
+        while offset < header_size:
+            serial_type, offset = Varint.decode(data, offset)
+            _, bytes_length = SQLiteSerialType.decode(serial_type)
+            serial_types.append((serial_type, bytes_length))
 
         return offset, serial_types
 
@@ -63,33 +61,21 @@ class SqliteSchemaRecord(RecordFormat):
     table_name: str
     rootpage: bytes
     sql: str
-    serial_types: list[tuple[str, int]]
+    serial_types: list[tuple[int, int]]
 
     @classmethod
-    def from_record(cls, data: bytes):
+    def from_record(cls, data: bytes | memoryview):
         offset, serial_types = cls.parse_header(data)
 
-        # With the serial types and associated sizes for each column
-        # we can start picking out the data
-        bytes_length = serial_types[0][1]
-        record_type = (data[offset : offset + bytes_length]).decode()
-        offset += bytes_length
-
-        bytes_length = serial_types[1][1]
-        name = (data[offset : offset + bytes_length]).decode()
-        offset += bytes_length
-
-        bytes_length = serial_types[2][1]
-        table_name = (data[offset : offset + bytes_length]).decode()
-        offset += bytes_length
-
-        bytes_length = serial_types[3][1]
-        rootpage = data[offset : offset + bytes_length]
-        offset += bytes_length
-
-        bytes_length = serial_types[4][1]
-        sql = (data[offset : offset + bytes_length]).decode()
-        offset += bytes_length
+        # With the serial types and associated sizes for each column we can
+        # work out where every column starts and ends, and pick out the data
+        offsets = accumulate(
+            (bytes_length for _, bytes_length in serial_types), initial=offset
+        )
+        fields = [data[start:end] for start, end in pairwise(offsets)]
+        record_type, name, table_name = (str(field, "utf-8") for field in fields[:3])
+        rootpage = bytes(fields[3])
+        sql = str(fields[4], "utf-8")
 
         return cls(
             record_type=record_type,
@@ -101,27 +87,114 @@ class SqliteSchemaRecord(RecordFormat):
         )
 
 
+# The serial type and starting offset of every column value stored in a record
+RecordLayout = list[tuple[int, int]]
+
+
 class UserTableRecord(RecordFormat):
     @classmethod
-    def from_record(cls, row_id: int, data: bytes, table_columns: list[str]):
-        offset, serial_types = cls.parse_header(data)
+    def from_record(
+        cls,
+        row_id: int,
+        data: bytes | memoryview,
+        table_columns: Sequence[str],
+        row_id_column: str | None = None,
+    ) -> tuple[Any, ...]:
+        decode = cls.row_decoder(table_columns, row_id_column)
+        return decode(row_id, data, cls.parse_layout(data))
+
+    @classmethod
+    def parse_layout(cls, data: bytes | memoryview) -> RecordLayout:
+        """
+        Parses the record header into where every column value starts, and how
+        to decode it. Checking a WHERE clause and decoding the row both work off
+        of the layout, so the header of a record only has to be parsed once.
+        """
+        # Same walk over the header as parse_header, but keeping a running
+        # offset into the values as well, so we only loop over it once
+        decode_varint, decode_serial_type = Varint.decode, SQLiteSerialType.decode
+        header_size, offset = decode_varint(data)
+        start = header_size
+
+        layout = []
+        while offset < header_size:
+            serial_type, offset = decode_varint(data, offset)
+            layout.append((serial_type, start))
+            start += decode_serial_type(serial_type)[1]
+
+        return layout
 
-        # For every column we have, pair it with a serial type
-        # and retrieve the associated data
-        columns: dict[str, Any] = {}
-        for column_idx, column in enumerate(table_columns):
-            if column == "id":
-                columns[column] = row_id
-                continue
-
-            bytes_length = serial_types[column_idx][1]
-            value: Any
-            try:
-                value = (data[offset : offset + bytes_length]).decode()
-            except UnicodeDecodeError:
-                # TODO: Check serial type instead of letting things blow up
-                value = int.from_bytes(data[offset : offset + bytes_length])
-            columns[column] = value
-            offset += bytes_length
-
-        return columns
+    @classmethod
+    def row_decoder(
+        cls, table_columns: Sequence[str], row_id_column: str | None = None
+    ) -> Callable[[int, bytes | memoryview, RecordLayout], tuple[Any, ...]]:
+        """
+        Builds a function that decodes records of a table with the given columns.
+        Everything that only depends on the table is worked out once, here,
+        instead of for every record we decode.
+        """
+        # The rowid alias column's value isn't in the record, we get it from the cell
+        row_id_columns = [column == row_id_column for column in table_columns]
+        column_count = len(table_columns)
+        read_value = SQLiteSerialType.read_value
+
+        def decode(
+            row_id: int, data: bytes | memoryview, layout: RecordLayout
+        ) -> tuple[Any, ...]:
+            # For every column we have, pair it with its serial type and the
+            # offset its value starts at, and retrieve the associated data.
+            # Rows are plain tuples, in the same order as the table's columns
+            values = [
+                row_id if is_row_id else read_value(serial_type, data, start)
+                for is_row_id, (serial_type, start) in zip(row_id_columns, layout)
+            ]
+            # Like in column_reader, columns added after the record was
+            # written aren't in it, so we fill them in with NULLs
+            if len(values) < column_count:
+                values.extend([None] * (column_count - len(values)))
+            return tuple(values)
+
+        return decode
+
+    @classmethod
+    def column_reader(
+        cls,
+        table_columns: Sequence[str],
+        column: str,
+        row_id_column: str | None = None,
+    ) -> Callable[[int, bytes | memoryview, RecordLayout], Any]:
+        """
+        Builds a function that decodes a single column of a record, without
+        decoding the columns before it. Useful to check a WHERE clause before
+        paying for the whole record.
+        """
+        if column == row_id_column:
+            return lambda row_id, data, layout: row_id
+
+        column_idx = table_columns.index(column)
+        read_value = SQLiteSerialType.read_value
+
+        def read(row_id: int, data: bytes | memoryview, layout: RecordLayout) -> Any:
+            # Records written before an ALTER TABLE ADD COLUMN don't
+            # hold the columns that came after, so those read as NULL
+            if column_idx >= len(layout):
+                return None
+            serial_type, start = layout[column_idx]
+            return read_value(serial_type, data, start)
+
+        return read
+
+    @classmethod
+    def get_column(
+        cls,
+        row_id: int,
+        data: bytes | memoryview,
+        table_columns: Sequence[str],
+        column: str,
+        row_id_column: str | None = None,
+    ) -> Any:
+        """
+        Decodes a single column of the record.
+        """
+        read = cls.column_reader(table_columns, column, row_id_column)
+        return read(row_id, data, cls.parse_layout(data))
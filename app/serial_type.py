@@ -1,5 +1,7 @@
 from enum import Enum
-from typing import Optional
+from functools import lru_cache
+from struct import Struct
+from typing import Any, Optional
 
 
 class SQLiteSerialType(Enum):
@@ -20,13 +22,16 @@ class SQLiteSerialType(Enum):
         self.description = description
         self.bytes_length = bytes_length
 
+    # There's only a handful of distinct codes in any one table, but we decode
+    # one for every column of every record, so remember what we worked out
     @staticmethod
+    @lru_cache(maxsize=None)
     def decode(code: int) -> tuple[str, int]:
         """Returns (description, bytes_length) for a given type code"""
-        # Handle predefined types
-        for member in SQLiteSerialType:
-            if member.code == code:
-                return member.description, member.bytes_length
+        # Handle predefined types, with a table lookup rather
+        # than scanning through every enum member
+        if 0 <= code < len(_PREDEFINED):
+            return _PREDEFINED[code]
 
         # Handle dynamic types
         if code >= 12:
@@ -45,3 +50,60 @@ class SQLiteSerialType(Enum):
     @property
     def is_text(self) -> bool:
         return self.code >= 13 and self.code % 2 == 1
+
+    @staticmethod
+    def read_integer(code: int, data: bytes, offset: int) -> int:
+        """Reads the big-endian two's-complement integer stored at data[offset]"""
+        # Types 8 and 9 are the constants 0 and 1, taking up no space at all
+        if code == SQLiteSerialType.INT_0.code:
+            return 0
+        if code == SQLiteSerialType.INT_1.code:
+            return 1
+
+        # Prebuilt structs unpack straight out of the buffer without slicing it
+        unpacker = _INTEGER_UNPACKERS.get(code)
+        if unpacker is not None:
+            return unpacker(data, offset)[0]
+
+        # 24 and 48-bit integers have no struct format
+        if code in (SQLiteSerialType.INT24.code, SQLiteSerialType.INT48.code):
+            _, bytes_length = SQLiteSerialType.decode(code)
+            return int.from_bytes(data[offset : offset + bytes_length], signed=True)
+
+        raise ValueError(f"Serial type code {code} is not an integer")
+
+    @staticmethod
+    def read_value(code: int, data: bytes, offset: int) -> Any:
+        """Reads the value of the given serial type stored at data[offset]"""
+        # Text is what we decode the most, so check for it first,
+        # working out its length straight from the code
+        if code >= 13 and code % 2 == 1:
+            bytes_length = (code - 13) // 2
+            if not bytes_length:
+                return ""
+            # str() decodes memoryviews as well as bytes
+            return str(data[offset : offset + bytes_length], "utf-8")
+        if code == SQLiteSerialType.NULL.code:
+            return None
+        if code == SQLiteSerialType.FLOAT64.code:
+            return _unpack_float64(data, offset)[0]
+        if code < len(_PREDEFINED):
+            return SQLiteSerialType.read_integer(code, data, offset)
+
+        _, bytes_length = SQLiteSerialType.decode(code)
+        return bytes(data[offset : offset + bytes_length])
+
+
+# Indexed by type code, which runs from 0 to 9 for the predefined types
+_PREDEFINED = tuple(
+    (member.description, member.bytes_length) for member in SQLiteSerialType
+)
+
+_unpack_float64 = Struct(">d").unpack_from
+
+_INTEGER_UNPACKERS = {
+    SQLiteSerialType.INT8.code: Struct(">b").unpack_from,
+    SQLiteSerialType.INT16.code: Struct(">h").unpack_from,
+    SQLiteSerialType.INT32.code: Struct(">i").unpack_from,
+    SQLiteSerialType.INT64.code: Struct(">q").unpack_from,
+}
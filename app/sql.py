@@ -1,58 +1,122 @@
-from sqlparse import parse as parse_sql
-from sqlparse import sql
+import re
+from functools import lru_cache
 from dataclasses import dataclass
 
+# Identifiers are either bare words or double quoted
+_IDENTIFIER = r'(?:"(?:[^"]|"")+"|\w+)'
 
-@dataclass
+_CREATE_TABLE = re.compile(
+    r"\s*create\s+table\s+(?:if\s+not\s+exists\s+)?"
+    rf"({_IDENTIFIER})\s*\((.*)\)\s*;?\s*",
+    re.IGNORECASE | re.DOTALL,
+)
+_SELECT = re.compile(
+    rf"\s*select\s+(.+?)\s+from\s+({_IDENTIFIER})(?:\s+where\s+(.+?))?\s*;?\s*",
+    re.IGNORECASE | re.DOTALL,
+)
+# A single `column <operator> value` comparison,
+# followed by an AND or the end of the clause
+_COMPARISON = re.compile(
+    rf"\s*({_IDENTIFIER})\s*(<=|>=|<>|!=|==|=|<|>|\blike\b)"
+    r"\s*('(?:[^']|'')*'|[^\s']+)\s*(?:\band\b|$)",
+    re.IGNORECASE,
+)
+# Only a column declared exactly as INTEGER PRIMARY KEY becomes an alias for
+# the rowid (INTEGER PRIMARY KEY DESC doesn't), so its value isn't stored in
+# the record. https://www.sqlite.org/lang_createtable.html#rowid
+_ROW_ID_ALIAS = re.compile(r"\s+integer\s+primary\s+key\b(?!\s+desc\b)", re.IGNORECASE)
+# Table constraints can follow the column definitions in a CREATE TABLE
+_TABLE_CONSTRAINT = re.compile(
+    r"(?:constraint|primary|unique|check|foreign)\b", re.IGNORECASE
+)
+
+
+# Parsed statements are cached and shared, so they're kept immutable
+@dataclass(frozen=True)
 class SQL:
     operation: str
-    columns: list[str]
+    columns: tuple[str, ...]
     table: str
-    where: dict[str, str] | None = None
+    # The (column, operator, value) comparisons ANDed together, in query
+    # order. A column can show up more than once, e.g. for ranges
+    where: tuple[tuple[str, str, str], ...] = ()
+    # The column of a CREATE TABLE that is an alias for the rowid, if any
+    row_id_column: str | None = None
 
+    # The same CREATE TABLE statements get parsed over
+    # and over again, so keep the results around
     @classmethod
+    @lru_cache(maxsize=128)
     def from_query(cls, query: str):
-        sql_statement = parse_sql(query)
-        tokens = sql_statement[0].tokens
-        operation = tokens[0].value.lower()
-        if operation == "create":
-            table = next(
-                token.value
-                for token in tokens[1:-2]
-                if isinstance(token, sql.Identifier)
+        # The statements we support are simple enough to pick apart with
+        # a few regular expressions, so we don't need a full SQL parser
+        if match := _CREATE_TABLE.fullmatch(query):
+            table, column_definitions = match.groups()
+            columns, row_id_column = [], None
+            for column_definition in _split_top_level(column_definitions):
+                if _TABLE_CONSTRAINT.match(column_definition):
+                    break
+                column = re.match(_IDENTIFIER, column_definition)
+                if column is None:
+                    raise Exception(
+                        f"Unsupported column definition: {column_definition}"
+                    )
+                columns.append(_unquote(column.group()))
+                if _ROW_ID_ALIAS.match(column_definition, column.end()):
+                    row_id_column = columns[-1]
+            return SQL(
+                operation="create",
+                table=_unquote(table),
+                columns=tuple(columns),
+                row_id_column=row_id_column,
+            )
+
+        if match := _SELECT.fullmatch(query):
+            column_list, table, where_clause = match.groups()
+            columns = tuple(column.strip() for column in column_list.split(","))
+
+            where = []
+            if where_clause:
+                offset = 0
+                while offset < len(where_clause):
+                    comparison = _COMPARISON.match(where_clause, offset)
+                    if comparison is None:
+                        raise Exception(f"Unsupported WHERE clause: {where_clause}")
+                    key, op, value = comparison.groups()
+                    op = op.lower()
+                    if value[0] == "'":
+                        value = value[1:-1].replace("''", "'")
+                    where.append((_unquote(key), "=" if op == "==" else op, value))
+                    offset = comparison.end()
+
+            return SQL(
+                operation="select",
+                columns=columns,
+                table=_unquote(table),
+                where=tuple(where),
             )
-            columns = tokens[-1]
-            columns = [
-                # This will extract the column names
-                token.lstrip(" \n\t(").split(" ")[0]
-                for token in columns.value.split(",")
-                if token not in ["(", ")"]
-            ]
-            return SQL(operation=operation, table=table, columns=columns)
-
-        elif operation == "select":
-            columns = []
-            where = {}
-            from_idx = next((idx for idx, t in enumerate(tokens) if t.value == "from"))
-            # Parse column names
-            for token in tokens[1:from_idx]:
-                if isinstance(token, sql.Function) or isinstance(token, sql.Identifier):
-                    columns.append(token.value)
-                elif isinstance(token, sql.IdentifierList):
-                    columns += map(lambda t: t.strip(), token.value.split(","))
-
-            # Parse the WHERE clause
-            where_token = next((t for t in tokens if isinstance(t, sql.Where)), None)
-            if where_token:
-                comparison_tokens = [
-                    t for t in where_token.tokens if isinstance(t, sql.Comparison)
-                ]
-                for t in comparison_tokens:
-                    key, value = t.value.split("=")
-                    where[key.strip()] = value.strip(" '")
-
-            # Skip the whitespace token and get to our table name
-            table = tokens[from_idx + 2].value
-            return SQL(operation=operation, columns=columns, table=table, where=where)
-        else:
-            raise Exception(f"Unsupported operation type: {operation}")
+
+        operation = (query.split(maxsplit=1) or [""])[0].lower()
+        raise Exception(f"Unsupported operation type: {operation}")
+
+
+def _split_top_level(column_definitions: str) -> list[str]:
+    # Split on the commas between column definitions, but not on the ones
+    # nested inside parentheses, e.g. in `price decimal(10, 2)`
+    parts, depth, start = [], 0, 0
+    for idx, char in enumerate(column_definitions):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(column_definitions[start:idx].strip())
+            start = idx + 1
+    parts.append(column_definitions[start:].strip())
+    return parts
+
+
+def _unquote(identifier: str) -> str:
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
@@ -1,5 +1,4 @@
 from dataclasses import dataclass
-from io import BufferedReader
 
 
 @dataclass
@@ -8,26 +7,47 @@ class Varint:
     bytes_length: int
 
     @classmethod
-    def from_data(cls, source: BufferedReader | bytes):
+    def from_data(cls, data: bytes):
+        # SQLite varints have at most 9 bytes
+        value, bytes_length = cls.decode(data)
+        return cls(value=value, bytes_length=bytes_length)
+
+    @staticmethod
+    def decode(data: bytes, offset: int = 0) -> tuple[int, int]:
+        """Returns (value, offset right past the varint) for the varint at data[offset]"""
+        # Most varints we come across (serial types, record sizes, small rowids)
+        # fit in one or two bytes, so handle those without entering the loop
+        byte = data[offset]
+        if byte < 0b10000000:
+            return byte, offset + 1
+        next_byte = data[offset + 1]
+        if next_byte < 0b10000000:
+            return ((byte & 0b01111111) << 7) | next_byte, offset + 2
+
         value = 0
-        bytes_read = 0
 
-        # SQLite varints have at most 9 bytes
-        while bytes_read < 9:
-            # Get next byte depending on source type
-            if isinstance(source, BufferedReader):
-                byte = source.read(1)[0]
-            else:
-                byte = source[bytes_read]
+        # Indexing into the buffer directly, so callers don't need to slice it first
+        for position in range(offset, offset + 8):
+            byte = data[position]
 
             # & 0b01111111 will shave off the highest bit - that's the varint value
             # << 7 will create space for the new incoming bits
             # | will append the new bits to value
             value = (value << 7) | (byte & 0b01111111)
-            bytes_read += 1
 
             # If highest bit is not set, we're done
             if not (byte & 0b10000000):
-                break
+                return value, position + 1
+
+        # The 9th byte, if we get that far, uses all of its 8 bits
+        return (value << 8) | data[offset + 8], offset + 9
 
-        return cls(value=value, bytes_length=bytes_read)
+    @staticmethod
+    def decode_signed(data: bytes, offset: int = 0) -> tuple[int, int]:
+        """Like decode, but reads the varint as a signed 64-bit integer, like rowids"""
+        value, offset = Varint.decode(data, offset)
+        # Negative values are stored in two's complement,
+        # which always takes up all 9 bytes
+        if value >= 1 << 63:
+            value -= 1 << 64
+        return value, offset
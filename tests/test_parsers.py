@@ -1,7 +1,67 @@
-from app.records import Record
+import sqlite3
+import sys
+
+import pytest
+
+from app.btree import IndexSearcher, RecordCollector
+from app.database import Database
+from app.main import main
+from app.page import Page, PageType, search_index, walk_btree
+from app.records import SqliteSchemaRecord, UserTableRecord
+from app.serial_type import SQLiteSerialType
+from app.sql import SQL
 from app.varint import Varint
 
 
+@pytest.fixture
+def database(tmp_path):
+    # A database built by sqlite3 itself, with enough rows
+    # for the table b-tree to need interior pages
+    path = tmp_path / "test.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "create table fruits (id integer primary key, name text, price integer)"
+        )
+        connection.executemany(
+            "insert into fruits (id, name, price) values (?, ?, ?)",
+            # Negative rowids are always stored as 9-byte varints
+            [
+                (row_id, f"fruit {row_id}", row_id * 10)
+                for row_id in [-5, *range(1, 2001)]
+            ],
+        )
+        # Most companies share a few countries, so runs of duplicate keys
+        # span several index pages, interior ones included
+        connection.execute(
+            "create table companies (id integer primary key, name text, country text)"
+        )
+        connection.execute("create index idx_companies_country on companies (country)")
+        countries = ["chad", "india", "india", "india", "peru", "peru"]
+        connection.executemany(
+            "insert into companies (id, name, country) values (?, ?, ?)",
+            [
+                (row_id, f"company {row_id}", countries[row_id % len(countries)])
+                for row_id in range(1, 6001)
+            ],
+        )
+        # An id column that isn't declared INTEGER PRIMARY KEY is a regular column
+        connection.execute("create table users (id text, name text)")
+        connection.executemany(
+            "insert into users (id, name) values (?, ?)",
+            [("9", "alice"), ("12", "bob")],
+        )
+        # Rows written before a column gets added don't store it at all
+        connection.execute("alter table users add column email text")
+        connection.execute(
+            "insert into users (id, name, email) values ('15', 'carol', 'c@example.com')"
+        )
+    connection.close()
+
+    database = Database(str(path))
+    yield database
+    database.close()
+
+
 class TestVarint:
     def test_should_parse_1_byte_varints(self):
         data = [0b01111111]
@@ -21,11 +81,261 @@ class TestVarint:
         assert varint.value == 199
         assert varint.bytes_length == 2
 
+    def test_should_parse_9_byte_varints(self):
+        # The 9th byte contributes all 8 of its bits
+        data = [0xFF] * 9
+
+        varint = Varint.from_data(data)
+        assert varint.value == 2**64 - 1
+        assert varint.bytes_length == 9
+
+    def test_should_decode_signed_varints(self):
+        data = bytes([0xFF] * 8 + [0xFB])
+
+        assert Varint.decode_signed(data) == (-5, 9)
+        assert Varint.decode_signed(bytes([0x81, 0x47])) == (199, 2)
+
+    def test_should_decode_varints_at_an_offset(self):
+        data = bytes([0x00, 0x81, 0x47, 0x05])
+
+        assert Varint.decode(data, 1) == (199, 3)
+        assert Varint.decode(data, 3) == (5, 4)
+
 
 class TestRecord:
     def test_should_parse_record_data(self):
         record_data = b"\x07\x17\x1b\x1b\x01\x81\x47\x74\x61\x62\x6c\x65\x6f\x72\x61\x6e\x67\x65\x73\x6f\x72\x61\x6e\x67\x65\x73\x04\x43\x52\x45\x41\x54\x45\x20\x54\x41\x42\x4c\x45\x20\x6f\x72\x61\x6e\x67\x65\x73\x0a\x28\x0a\x09\x69\x64\x20\x69\x6e\x74\x65\x67\x65\x72\x20\x70\x72\x69\x6d\x61\x72\x79\x20\x6b\x65\x79\x20\x61\x75\x74\x6f\x69\x6e\x63\x72\x65\x6d\x65\x6e\x74\x2c\x0a\x09\x6e\x61\x6d\x65\x20\x74\x65\x78\x74\x2c\x0a\x09\x64\x65\x73\x63\x72\x69\x70\x74\x69\x6f\x6e\x20\x74\x65\x78\x74\x0a\x29\x50"
-        record = Record.from_data(record_data)
+        record = SqliteSchemaRecord.from_record(record_data)
         assert record.record_type == "table"
         assert record.name == "oranges"
         assert record.table_name == "oranges"
+        assert record.rootpage == b"\x04"
+        assert record.sql.startswith("CREATE TABLE oranges")
+
+
+class TestRowIdSeek:
+    def seek(self, database, target_row_id):
+        table_record = database.schema[("table", "fruits")]
+        root_page_number = int.from_bytes(table_record.rootpage, byteorder="big") - 1
+        root_page = Page.get_page(database, root_page_number)
+        return list(
+            walk_btree(
+                root_page, database, RecordCollector(target_row_id), target_row_id
+            )
+        )
+
+    def test_should_seek_to_a_row_id(self, database):
+        ((row_id, row),) = self.seek(database, 1234)
+        assert row_id == 1234
+        columns = ["id", "name", "price"]
+        assert UserTableRecord.from_record(row_id, row, columns, "id") == (
+            1234,
+            "fruit 1234",
+            12340,
+        )
+
+    def test_should_find_nothing_for_missing_row_ids(self, database):
+        assert self.seek(database, 5000) == [None]
+        assert self.seek(database, 0) == [None]
+
+
+class TestIndexSearch:
+    def search(self, database, country):
+        index_record = database.schema[("index", "idx_companies_country")]
+        index_root_page = Page.get_page(
+            database, int.from_bytes(index_record.rootpage, byteorder="big") - 1
+        )
+        # Only worth checking if the entries don't all fit on one page
+        assert index_root_page.type == PageType.INTERIOR_INDEX_B_TREE
+        walker = IndexSearcher(database, country.encode())
+        return sorted(
+            row_id
+            for row_ids in search_index(index_root_page, database, walker)
+            for row_id in row_ids
+        )
+
+    @pytest.mark.parametrize(
+        "country",
+        [
+            "chad",
+            "india",
+            "peru",
+            # Before the first key, in between keys and past the last one
+            "albania",
+            "mali",
+            "zambia",
+        ],
+    )
+    def test_should_find_the_same_rowids_as_sqlite(self, database, country):
+        with sqlite3.connect(database.path) as connection:
+            expected = [
+                row_id
+                for (row_id,) in connection.execute(
+                    "select id from companies where country = ? order by id",
+                    (country,),
+                )
+            ]
+        connection.close()
+
+        assert self.search(database, country) == expected
+
+
+class TestSQLiteSerialType:
+    def test_should_read_integers_by_serial_type(self):
+        data = b"\xff\x01\x00\x00\x00\x00\x00\x00\x00\x07"
+
+        assert SQLiteSerialType.read_integer(1, data, 0) == -1
+        assert SQLiteSerialType.read_integer(3, data, 1) == 65536
+        assert SQLiteSerialType.read_integer(6, data, 2) == 7
+
+    def test_should_read_constant_integers_without_data(self):
+        assert SQLiteSerialType.read_integer(8, b"", 0) == 0
+        assert SQLiteSerialType.read_integer(9, b"", 0) == 1
+
+    def test_should_read_values_by_serial_type(self):
+        data = b"\x05red\x3f\xf8\x00\x00\x00\x00\x00\x00"
+
+        assert SQLiteSerialType.read_value(0, data, 0) is None
+        assert SQLiteSerialType.read_value(1, data, 0) == 5
+        assert SQLiteSerialType.read_value(19, data, 1) == "red"
+        assert SQLiteSerialType.read_value(13, data, 1) == ""
+        assert SQLiteSerialType.read_value(18, data, 1) == b"red"
+        assert SQLiteSerialType.read_value(7, data, 4) == 1.5
+
+
+class TestUserTableRecord:
+    # Header size, then serial types for a NULL id (it's the rowid alias),
+    # a 5-byte TEXT and a 3-byte TEXT, followed by the column values
+    record_data = b"\x04\x00\x17\x13applered"
+    table_columns = ["id", "name", "color"]
+
+    def test_should_parse_all_columns(self):
+        record = UserTableRecord.from_record(
+            7, self.record_data, self.table_columns, "id"
+        )
+        assert record == (7, "apple", "red")
+
+    def test_should_parse_where_every_column_starts(self):
+        layout = UserTableRecord.parse_layout(self.record_data)
+        assert layout == [(0, 4), (23, 4), (19, 9)]
+
+        read_color = UserTableRecord.column_reader(self.table_columns, "color")
+        assert read_color(7, self.record_data, layout) == "red"
+
+    def test_should_get_a_single_column(self):
+        get_column = UserTableRecord.get_column
+        record_data, table_columns = self.record_data, self.table_columns
+        assert get_column(7, record_data, table_columns, "id", "id") == 7
+        assert get_column(7, record_data, table_columns, "name", "id") == "apple"
+        assert get_column(7, record_data, table_columns, "color", "id") == "red"
+
+    def test_should_read_an_id_column_that_isnt_the_rowid_alias(self):
+        # Without a rowid alias, the id column has its value stored like any other
+        record_data = b"\x03\x13\x13bobred"
+        table_columns = ["id", "name"]
+
+        record = UserTableRecord.from_record(7, record_data, table_columns)
+        assert record == ("bob", "red")
+        get_column = UserTableRecord.get_column
+        assert get_column(7, record_data, table_columns, "id") == "bob"
+        assert get_column(7, record_data, table_columns, "name") == "red"
+
+    def test_should_read_columns_missing_from_the_record_as_null(self):
+        # Records written before an ALTER TABLE ADD COLUMN are shorter
+        table_columns = [*self.table_columns, "size"]
+        get_column = UserTableRecord.get_column
+        assert get_column(7, self.record_data, table_columns, "size") is None
+
+    def test_should_decode_columns_missing_from_the_record_as_null(self):
+        table_columns = [*self.table_columns, "size"]
+        record = UserTableRecord.from_record(7, self.record_data, table_columns, "id")
+        assert record == (7, "apple", "red", None)
+
+
+class TestSQL:
+    def test_should_parse_create_table_statements(self):
+        query = 'CREATE TABLE companies\n(\n\tid integer primary key autoincrement\n, name text, "size range" text, price decimal(10, 2))'
+        create_query = SQL.from_query(query)
+        assert create_query.table == "companies"
+        assert create_query.columns == ("id", "name", "size range", "price")
+        assert create_query.row_id_column == "id"
+
+    def test_should_only_alias_the_rowid_for_integer_primary_keys(self):
+        for query, row_id_column in [
+            ("create table t (id text, name text)", None),
+            ("create table t (id int primary key, name text)", None),
+            ("create table t (id integer primary key desc, name text)", None),
+            ('create table t (name text, "my id" INTEGER PRIMARY KEY)', "my id"),
+        ]:
+            assert SQL.from_query(query).row_id_column == row_id_column
+
+    def test_should_parse_select_statements(self):
+        query = "select id, name from companies where country = 'bosnia and herzegovina' and id = 3"
+        select_query = SQL.from_query(query)
+        assert select_query.columns == ("id", "name")
+        assert select_query.table == "companies"
+        assert select_query.where == (
+            ("country", "=", "bosnia and herzegovina"),
+            ("id", "=", "3"),
+        )
+
+    def test_should_parse_where_operators(self):
+        query = "select name from companies where year_founded >= 1999 and name like 'a%' and country != 'chad'"
+        select_query = SQL.from_query(query)
+        assert select_query.where == (
+            ("year_founded", ">=", "1999"),
+            ("name", "like", "a%"),
+            ("country", "!=", "chad"),
+        )
+
+    def test_should_keep_every_comparison_on_a_column(self):
+        select_query = SQL.from_query("select id from fruits where id > 5 and id < 10")
+        assert select_query.where == (("id", ">", "5"), ("id", "<", "10"))
+
+
+class TestSelect:
+    @pytest.fixture
+    def select(self, database, monkeypatch, capsys):
+        # Runs a query through the CLI and hands back the printed rows
+        def select(query):
+            monkeypatch.setattr(sys, "argv", ["main.py", database.path, query])
+            main()
+            return capsys.readouterr().out.splitlines()
+
+        return select
+
+    def test_should_filter_on_a_range_over_one_column(self, select):
+        assert select("select id from fruits where id > 5 and id < 10") == [
+            "6",
+            "7",
+            "8",
+            "9",
+        ]
+        assert select(
+            "select name from fruits where price >= 150 and price <= 170"
+        ) == ["fruit 15", "fruit 16", "fruit 17"]
+
+    def test_should_check_other_comparisons_when_seeking_a_row_id(self, select):
+        assert select("select name from fruits where id = 3 and id < 2") == []
+        assert select("select name from fruits where id = 3 and id > 2") == ["fruit 3"]
+
+    def test_should_only_seek_on_a_rowid_alias(self, select):
+        assert select("select name from users where id = '9'") == ["alice"]
+        assert select("select id, name from users where id = 12") == ["12|bob"]
+
+    def test_should_read_negative_rowids(self, select):
+        assert select("select id, name from fruits where id < 2") == [
+            "-5|fruit -5",
+            "1|fruit 1",
+        ]
+        assert select("select name from fruits where id = -5") == ["fruit -5"]
+
+    def test_should_read_columns_added_after_a_row_was_written_as_null(self, select):
+        assert select("select id, email from users") == [
+            "9|",
+            "12|",
+            "15|c@example.com",
+        ]
+        assert select("select name from users where email = 'c@example.com'") == [
+            "carol"
+        ]